@@ -34,7 +34,7 @@ class Hamiltonian:
             case _: # noqa
                 raise ValueError("Invalid backend:", backend)
 
-    def local_energy(self, wf, r):
+    def local_energy(self, wf, r, alpha=None):
         """Local energy of the system"""
         raise NotImplementedError
 
@@ -68,13 +68,23 @@ class HarmonicOscillator(Hamiltonian):
     # easily compiled in JAX. The JNP.arrays should be used _only_ where we can actually run the
     # JAX JIT compiler. I think it'll potentially reduce the performance of the program otherwise.
     
-    def kinetic_energy(self, r):
-        """Kinetic energy of the system"""
-        # I believe there should be a way to easily parallelize this for loop (i.e split it into smaller for-loops that run in parallel)
-        
+    def kinetic_energy(self, r, alpha=None):
+        """Kinetic energy of the system
+
+        alpha defaults to the current variational parameter of the wavefunction. Pass it explicitly when
+        alpha is traced, e.g. inside the lax.scan training loop.
+        """
+        if alpha is None:
+            alpha = self.alg_int._alpha
+
+        if self._int_type != "Coulomb":
+            # Without interaction the laplacian handles the whole (N, dim) configuration in a single call
+            return -0.5 * self.alg_int.laplacian_closure(r, alpha, self.alg_int.beta)
+
+        # The interacting laplacian looks up the particle in the current state, so it is evaluated one particle at a time
         laplacian = 0
         for i in range(self._N):
-            laplacian += self.alg_int.laplacian(r[i])
+            laplacian += self.alg_int.laplacian_closure(r[i], alpha, self.alg_int.beta)
             # if jnp.abs(self.alg_int.laplacian(r[i])) > 20:
             #     print(f"term1: {self.alg_int.first_term}, term2: {self.alg_int.second_term}"
             #           + "\n" + f"term3: {self.alg_int.third_term}, term4: {self.alg_int.fourth_term}")
@@ -82,7 +92,7 @@ class HarmonicOscillator(Hamiltonian):
 
         return -0.5 * laplacian
     
-    def local_energy(self, wf, r):
+    def local_energy(self, wf, r, alpha=None):
         """Local energy of the system
         Calculates the local energy of a system with positions `r` and wavefunction `wf`.
         `wf` is assumed to be the log of the wave function.
@@ -90,7 +100,7 @@ class HarmonicOscillator(Hamiltonian):
         # Potential Energy
         pe = 0.5 * self.backend.sum(self.backend.sum(r**2, axis=1))  # Use self.backend to support numpy/jax.numpy 
         # Kinetic energy
-        ke = self.kinetic_energy(r)
+        ke = self.kinetic_energy(r, alpha)
         # Correct calculation of local energy
         local_energy = ke + pe
 
@@ -122,7 +132,7 @@ class EllipticOscillator(HarmonicOscillator):
             
         return pe + int_energy
     
-    def local_energy(self, wf, r):
+    def local_energy(self, wf, r, alpha=None):
         ###TODO Impliment local energy for EO
 
         """Local energy of the system
@@ -132,7 +142,7 @@ class EllipticOscillator(HarmonicOscillator):
         # Adjust the potential energy calculation for the elliptic oscillator
         # Assuming r is structured as [nparticles, dim], and the first column is x, second is y, and the third is z.
         pe = self.potential_energy(r)
-        ke = self.kinetic_energy(r)
+        ke = self.kinetic_energy(r, alpha)
         
         # Kinetic Energy using automatic differentiation on the log of the wavefunction 
         #print(" laplacian shape ", self.backend.sum(self.alg_int.laplacian(r)).shape)
@@ -1,3 +1,4 @@
+import functools
 import jax
 import jax.numpy as jnp
 import jax.random as random
@@ -7,6 +8,78 @@ from qs.utils import Parameter # IMPORTANT: you may or may not use this dependin
 from qs.utils import State
 import pdb
 from simulation_scripts import config
+
+KEY_POOL_SIZE = 64  # Number of PRNG keys split at once by VMC.next_key
+
+
+# Jitted pure versions of the VMC closures for the jax backend. They live at module level so the compile cache is
+# shared by every VMC instance (e.g. in a hyperparameter sweep) instead of being re-jitted per instance,
+# see VMC._jit_functions.
+
+@jax.jit
+def _wf_pure(r, alpha, beta):
+    """Log wavefunction of each particle, see VMC.wf_closure"""
+    return -alpha * (beta**2 * (r[:, 0]**2) + jnp.sum(r[:, 1:]**2, axis=1))
+
+
+@jax.jit
+def _prob_pure(r, alpha, beta):
+    """|Ψ(alpha, r)|^2 in log domain, see VMC.prob_closure"""
+    # 2 * _wf_pure written out, so a prob query is a single jitted function instead of two nested ones
+    return -2.0 * alpha * (beta**2 * (r[:, 0]**2) + jnp.sum(r[:, 1:]**2, axis=1))
+
+
+@jax.jit
+def _grad_wf_pure(r, alpha, beta):
+    """
+    Gradient of the log wavefunction with respect to r, with jax grad
+    """
+    # Note: jax.grad expects a scalar output, so we sum over the particles to get a single value.
+    return jax.grad(lambda positions: jnp.sum(_wf_pure(positions, alpha, beta)))(r)
+
+
+@jax.jit
+def _laplacian_pure(r, alpha, beta):
+    """
+    Laplacian of the log wavefunction, summed over the particles, using JAX automatic differentiation.
+    r: Position array of shape (n_particles, n_dimensions), or (n_dimensions,) for a single particle
+    """
+    r = r.reshape(-1, r.shape[-1])
+
+    def single_particle_laplacian(r_i):
+        grad_fn = jax.grad(lambda x: jnp.sum(_wf_pure(x[None, :], alpha, beta)))
+
+        # The Hessian of the Gaussian log wavefunction is diagonal, so the Hessian-vector product with ones
+        # already holds its diagonal. The primal output of the jvp is the gradient itself, so one
+        # forward-over-reverse pass gives both terms.
+        grad_log_psi, hvp = jax.jvp(grad_fn, (r_i,), (jnp.ones_like(r_i),))
+        return jnp.sum(hvp) + jnp.sum(grad_log_psi * grad_log_psi)
+
+    # Batch over the particles so a whole configuration is a single call
+    return jnp.sum(jax.vmap(single_particle_laplacian)(r))
+
+
+@functools.partial(jax.jit, static_argnames=("use_ad",))
+def _grads_pure(r, alpha, beta, use_ad=False):
+    """
+    Gradient of the log wavefunction with respect to alpha for a batch r of shape (batch, N, dim).
+    The log wavefunction is linear in alpha, so the gradient is known in closed form and no AD graph is needed.
+    With use_ad=True it is instead computed with JAX grad using Vmap, which is kept for regression testing.
+    """
+    if not use_ad:
+        # d/dalpha of -alpha * (beta^2 x^2 + y^2 + z^2), summed over the particles of each sample in the batch
+        return -(beta**2 * jnp.sum(r[..., 0] * r[..., 0], axis=1) + jnp.sum(r[..., 1:] * r[..., 1:], axis=(1, 2)))
+
+    # Define the gradient function for a single instance
+    def single_grad(pos, var):
+        return jax.grad(lambda a: jnp.sum(_wf_pure(pos, a, beta)))(var)
+
+    # Vectorize the gradient computation over the batch dimension
+    batched_grad = jax.vmap(single_grad, (0, None), 0)
+
+    return jnp.squeeze(batched_grad(r, alpha))
+
+
 class VMC:
     def __init__(
         self,
@@ -34,6 +107,7 @@ class VMC:
         self.radius = config.radius
         self.beta = beta
         self.rng = random.PRNGKey(self._seed)  # Initialize RNG with the provided seed
+        self._refill_key_pool()
         
         if alpha:
             self._initialize_variational_params(alpha)
@@ -53,16 +127,46 @@ class VMC:
             self._logger.info(msg)
 
 
-    def generate_normal_matrix(self, n, m):
-        """Generate a matrix of normally distributed numbers with shape (n, m)."""
+    def _refill_key_pool(self):
+        """Split KEY_POOL_SIZE keys from self.rng in a single call, to be handed out by next_key."""
+        keys = random.split(self.rng, KEY_POOL_SIZE + 1)
+        self.rng = keys[0]
+        self._key_pool = keys[1:]
+        self._key_index = 0
+
+    def next_key(self):
+        """Return a fresh PRNG key from the key pool, refilling the pool from self.rng when it is used up."""
+        if self._key_index == KEY_POOL_SIZE:
+            self._refill_key_pool()
+
+        key = self._key_pool[self._key_index]
+        self._key_index += 1
+
+        return key
+
+    def prime_keys(self, n):
+        """Split the RNG key into n subkeys at once, e.g. one per MCMC step.
+
+        The first key replaces self.rng for future use and the remaining n are returned, so a sampling loop can be
+        driven by the subkeys without touching self.rng on every step.
+        """
         if self.rng is None:
             raise ValueError("RNG key not initialized. Call set_rng first.")
 
-        # Split the key: one for generating numbers now, one for future use.
-        self.rng, subkey = random.split(self.rng)
-        
-        # Generate the normally distributed numbers
-        return random.normal(subkey, shape=(n, m))
+        keys = random.split(self.rng, n + 1)
+        self.rng = keys[0]
+
+        return keys[1:]
+
+    def generate_normal_block(self, nsamples, n, m, key=None):
+        """Generate nsamples matrices of normally distributed numbers at once, with shape (nsamples, n, m).
+
+        One large draw for e.g. the proposal noise of a whole chain, instead of one draw per step.
+        """
+        if key is None:
+            key = self.next_key()
+
+        return random.normal(key, shape=(nsamples, n, m))
 
 
 
@@ -83,17 +187,18 @@ class VMC:
             # These are also the _only_ functions that should be written in JAX code, but should we then
             # convert back and forth from JAX <-> NumPy arrays throughout the program? 
             # Need to discuss with Daniel.
-            self.grad_wf_closure = self.grad_wf_closure_jax
-            self.grads_closure = self.grads_closure_jax
-            self.laplacian_closure = self.laplacian_closure_jax
             self._jit_functions()
         else:
             raise ValueError(f"Backend {self.backend} not supported")
         
 
-        if config.interaction == "Coulomb" or config.hamiltonian == "eo":
+        # The interacting wavefunction reads the pair distances of the current state, so its closures are not pure
+        self._interacting = config.interaction == "Coulomb" or config.hamiltonian == "eo"
+
+        if self._interacting:
             print("Coulomb interaction")
             self.wf_closure = self.wf_closure_int
+            self.prob_closure = self.prob_closure_int
         
         if config.interaction == "Coulomb" and config.hamiltonian == "eo":
             self.laplacian_closure = self.anal_laplacian_closure_int
@@ -108,19 +213,24 @@ class VMC:
         However, you should be careful with how you jit functions.
         They have to be pure functions, meaning they cannot have side effects (modify some state variable values outside its local environment)
         Take a close look at "https://jax.readthedocs.io/en/latest/notebooks/Common_Gotchas_in_JAX.html"
-        """
 
-        functions_to_jit = [
-                "prob_closure",
-                "wf_closure",
-                "grad_wf_closure",
-                "laplacian_closure",
-                "grads_closure",
-            ]
-        
+        The jitted versions are the module-level pure functions above (_wf_pure and friends). Pointing the closures
+        at them, rather than wrapping each instance's bound methods in jax.jit, means the compile cache is shared by all
+        VMC instances and a new instance (e.g. in a hyperparameter sweep) does not trigger a new compile.
+        beta is passed as a regular argument rather than read from self.beta, which jit would bake in as a constant
+        at trace time and silently keep using if self.beta were changed later.
+
+        Calling this again is a no-op, so the closures are only pointed at the shared jitted functions once.
+        """
+        if getattr(self, "_is_jitted", False):
+            return self
+        self._is_jitted = True
 
-        for func in functions_to_jit:
-            setattr(self, func, jax.jit(getattr(self, func)))
+        self.prob_closure = _prob_pure
+        self.wf_closure = _wf_pure
+        self.grad_wf_closure = _grad_wf_pure
+        self.laplacian_closure = _laplacian_pure
+        self.grads_closure = _grads_pure
         return self
     
 
@@ -130,50 +240,53 @@ class VMC:
 
         OBS: We strongly recommend you work with the wavefunction in log domain. 
         """
-        alpha = self.params.get("alpha")  # Using Parameter.get to access alpha
+        alpha = self._alpha
         
-        return self.wf_closure(r, alpha)
+        return self.wf_closure(r, alpha, self.beta)
 
 
     
-    def wf_closure_train(self, r, alpha):
+    def wf_closure_train(self, r, alpha, beta):
         """
         
         r: (N, dim) array so that r_i is a dim-dimensional vector
         alpha: (N, dim) array so that alpha_i is a dim-dimensional vector
+        beta: ellipticity of the trap along x
 
         return: should return Ψ(alpha, r)
 
         OBS: We strongly recommend you work with the wavefunction in log domain. 
 
         """
-        wf = -alpha * (self.beta**2 * (r[:, 0]**2) + self.backend.sum(r[:, 1:]**2, axis=1))
+        wf = -alpha * (beta**2 * (r[:, 0]**2) + self.backend.sum(r[:, 1:]**2, axis=1))
 
     
         return (wf) 
     
 
-    def wf_closure(self, r, alpha):
+    def wf_closure(self, r, alpha, beta):
         """
         
         r: (N, dim) array so that r_i is a dim-dimensional vector
         alpha: (N, dim) array so that alpha_i is a dim-dimensional vector
+        beta: ellipticity of the trap along x
 
         return: should return Ψ(alpha, r)
 
         OBS: We strongly recommend you work with the wavefunction in log domain. 
 
         """
-        wf = -alpha * (self.beta**2 * (r[:, 0]**2) + self.backend.sum(r[:, 1:]**2, axis=1))
+        wf = -alpha * (beta**2 * (r[:, 0]**2) + self.backend.sum(r[:, 1:]**2, axis=1))
 
     
         return (wf) 
     
-    def wf_closure_int(self, r, alpha):
+    def wf_closure_int(self, r, alpha, beta):
         """
         
         r: (N, dim) array so that r_i is a dim-dimensional vector
         alpha: (1,1) array so that alpha is just a number but in the array form
+        beta: ellipticity of the trap along x
 
         return: should return a an array of the wavefunction for each particle ( N, )
 
@@ -181,27 +294,38 @@ class VMC:
         """
         
 
-        g =  -alpha * (self.beta**2 * (r[:, 0]**2) + self.backend.sum(r[:, 1:]**2, axis=1)) # Sum over the coordinates x^2 + y^2 + z^2 for each particle
+        g =  -alpha * (beta**2 * (r[:, 0]**2) + self.backend.sum(r[:, 1:]**2, axis=1)) # Sum over the coordinates x^2 + y^2 + z^2 for each particle
+        wf = g + self.jastrow_term()
+      
+        return wf 
+
+    def jastrow_term(self):
+        """
+        Log of the pair correlation factor of each particle, shape (N,), from the pair distances of the current state
+        """
         # Calculate pairwise distances.
-        # breakpoint()
         distances = self.la.norm(self.state.r_dist, axis=-1)
         # Compute f using the masked distances
-        f = jnp.log(jnp.where(distances < self.radius, 0, 1 - self.radius / distances) + jnp.eye(r.shape[0]))
-        f_term = self.backend.sum(f, axis = 1)
-        wf = g + f_term
-      
-        return wf 
+        f = jnp.log(jnp.where(distances < self.radius, 0, 1 - self.radius / distances) + jnp.eye(self._N))
 
+        return self.backend.sum(f, axis = 1)
 
-    def prob_closure(self, r, alpha):
+
+    def prob_closure(self, r, alpha, beta):
         """
         Return a function that computes |Ψ(alpha, r)|^2
 
         OBS: We strongly recommend you work with the wavefunction in log domain. 
         """
-        
-        
-        log_psi = self.wf_closure(r, alpha)
+        # 2 * wf_closure written out, so a prob query is a single jitted function instead of two nested ones
+        return -2.0 * alpha * (beta**2 * (r[:, 0]**2) + self.backend.sum(r[:, 1:]**2, axis=1))
+
+    def prob_closure_int(self, r, alpha, beta):
+        """
+        Computes |Ψ(alpha, r)|^2 in log domain for the interacting wavefunction.
+        Not jitted, as wf_closure_int reads the pair distances of the current state.
+        """
+        log_psi = self.wf_closure_int(r, alpha, beta)
         return 2 * log_psi  # Since we're working in the log domain
 
 
@@ -211,10 +335,58 @@ class VMC:
 
         OBS: We strongly recommend you work with the wavefunction in log domain. 
         """
-        alpha = self.params.get("alpha")  # Using Parameter.get to access alpha 
-        return self.prob_closure(r, alpha)
+        alpha = self._alpha
+        return self.prob_closure(r, alpha, self.beta)
+
+    def prob_pair(self, r_current, r_proposed):
+        """
+        |Ψ(alpha, r)|^2 in log domain of both the current and the proposed positions of an MCMC step.
+
+        The interacting wavefunction reads the pair distances of the current state for both, so here the
+        correlation term is computed once and shared instead of once per evaluation.
+        """
+        alpha = self._alpha
+        if not self._interacting:
+            return self.prob_closure(r_current, alpha, self.beta), self.prob_closure(r_proposed, alpha, self.beta)
+
+        f_term = self.jastrow_term()
+        prob_current = 2 * (self.wf_from_r2(self.r2_closure(r_current), alpha) + f_term)
+        prob_proposed = 2 * (self.wf_from_r2(self.r2_closure(r_proposed), alpha) + f_term)
+
+        return prob_current, prob_proposed
+
+    def wf_squared_ratio(self, positions, i, delta, alpha=None, backend=None):
+        """
+        log |Ψ(r')/Ψ(r)|^2 for moving particle i of positions by delta, where r' is positions with row i moved.
+
+        Only the i-th particle and its row of the pair distances enter, so this is O(N) instead of evaluating
+        the whole configuration twice. Used by the single particle Metropolis step, which passes backend=np and
+        a host copy of alpha to evaluate it on host. alpha and backend default to self._alpha and self.backend.
+        """
+        backend = self.backend if backend is None else backend
+        alpha = self._alpha if alpha is None else alpha
+        r_old = positions[i]
+        r_new = r_old + delta
 
-    def grad_wf_closure(self, r, alpha):
+        def r2(x):
+            return self.beta**2 * x[0] * x[0] + backend.sum(x[1:] * x[1:])
+
+        log_ratio = -2 * alpha * (r2(r_new) - r2(r_old))
+
+        if self._interacting:
+            # Particle i is left out by putting it at infinite distance, where the correlation factor is 1
+            others = backend.arange(self._N) != i
+            d_old = backend.where(others, backend.linalg.norm(positions - r_old, axis=1), backend.inf)
+            d_new = backend.where(others, backend.linalg.norm(positions - r_new, axis=1), backend.inf)
+
+            def log_f(d):
+                return backend.log(backend.where(d < self.radius, 0, 1 - self.radius / d))
+
+            log_ratio += 2 * backend.sum(log_f(d_new) - log_f(d_old))
+
+        return log_ratio
+
+    def grad_wf_closure(self, r, alpha, beta):
         """
         Computes the gradient of the wavefunction with respect to r analytically
         Is overwritten by the JAX version if backend is JAX
@@ -226,28 +398,15 @@ class VMC:
         return -2 * alpha * r
         
 
-    def grad_wf_closure_jax(self, r, alpha):
-        """
-        computes the gradient of the wavefunction with respect to r, but with jax grad
-        """
-        
-    
-        # Now we use jax.grad to compute the gradient with respect to the first argument (r)
-        # Note: jax.grad expects a scalar output, so we sum over the particles to get a single value.
-        grad_log_psi = jax.grad(lambda positions: jnp.sum(self.wf_closure(positions, alpha)), argnums=0)
-
-        return grad_log_psi(r)
-        
-
     def grad_wf(self, r):
         """
         Helper for the gradient of the wavefunction with respect to r
 
         OBS: We strongly recommend you work with the wavefunction in log domain. 
         """
-        alpha = self.params.get("alpha")  # Using Parameter.get to access alpha 
+        alpha = self._alpha
         
-        return self.grad_wf_closure(r, alpha)
+        return self.grad_wf_closure(r, alpha, self.beta)
     
 
     def grads(self, r):
@@ -256,41 +415,23 @@ class VMC:
 
         OBS: We strongly recommend you work with the wavefunction in log domain. 
         """
-        alpha = self.params.get("alpha")  # Using Parameter.get to access alpha 
+        alpha = self._alpha
    
 
-        return self.grads_closure(r, alpha)
+        return self.grads_closure(r, alpha, self.beta)
 
-    def grads_closure(self, r, alpha):
+    def grads_closure(self, r, alpha, beta):
         """
         Computes the gradient of the wavefunction with respect to the variational parameters analytically
         """
     
         # For the given trial wavefunction, the gradient with respect to alpha is the negative of the wavefunction
         # times the sum of the squares of the positions, since the wavefunction is exp(-alpha * sum(r_i^2)).
-        grad_alpha = self.backend.sum( -self.backend.sum(r**2, axis=2) , axis = 1)  # The gradient with respect to alpha
+        # r is (batch, N, dim), einsum reduces each sample in a single pass without materializing r**2.
+        grad_alpha = -self.backend.einsum("bnd,bnd->b", r, r)  # The gradient with respect to alpha
 
-        
         return grad_alpha
 
-    def grads_closure_jax(self, r, alpha):
-        """
-        Computes the gradient of the wavefunction with respect to the variational parameters with JAX grad using Vmap.
-        """
-
-        # Define the gradient function for a single instance
-        def single_grad(pos, var):
-            return jax.grad(lambda a: jnp.sum(self.wf_closure_train(pos, a)))(var) 
-        
-        # Vectorize the gradient computation over the batch dimension
-        batched_grad = jax.vmap(single_grad, (0, None), 0)
-        
-        # Compute gradients for the entire batch
-        grad_alpha = batched_grad(r, alpha)
-        
-        return self.backend.squeeze(grad_alpha)
-
-
     
     def laplacian(self, r):
         """
@@ -299,29 +440,53 @@ class VMC:
         OBS: We strongly recommend you work with the wavefunction in log domain. 
         """
        
-        alpha = self.params.get("alpha")  # Using Parameter.get to access alpha 
-        return self.laplacian_closure(r, alpha)
+        alpha = self._alpha
+        return self.laplacian_closure(r, alpha, self.beta)
     
 
 
-    def laplacian_closure(self, r, alpha):
+    def laplacian_closure(self, r, alpha, beta):
         """
         Analytical expression for the laplacian of the wavefunction
         """
-        # print("ANALITICAL")
-        # For a Gaussian wavefunction in log domain, the Laplacian is simply 2*alpha*d - 4*alpha^2*sum(r_i^2),
-        # where d is the number of dimensions.
-        #print("r shape BEFORE ", r.shape)
-        r = r.reshape(-1, self._dim)  # Reshape to (1 , n_dimensions)
-        #print("r shape AFTER ", r.shape)
+        N = r.size // self._dim  # Number of particles, r is either (dim,) or (N, dim)
+        r = r.reshape(N, self._dim)
+        # einsum reduces each particle in a single pass without materializing r**2
+        sq_norm = self.backend.einsum("ij,ij->i", r, r)
 
-        d = r.shape[1]  # Number of dimensions
-        r2 =  self.backend.sum(r**2, axis=1)
-        
-        laplacian = 4* alpha**2 * r2 - 2 * alpha * d # is this the actual log domain? what is the log domain?
-        laplacian = self.backend.sum(laplacian.reshape(-1, 1))  # Reshape to (n_particles, 1)
-    
-        return laplacian
+        return self.laplacian_from_sq_norm(sq_norm, alpha)
+
+    def r2_closure(self, r):
+        """
+        Squared radius of each particle as it enters the wavefunction, beta^2 * x^2 + y^2 + z^2
+
+        r: (N, dim) array, returns an (N,) array. It does not depend on alpha, so it can be computed once per
+        MCMC step and shared by wf_from_r2 and prob_from_r2.
+        """
+        return self.beta**2 * (r[:, 0] * r[:, 0]) + self.backend.einsum("ij,ij->i", r[:, 1:], r[:, 1:])
+
+    def wf_from_r2(self, r2, alpha):
+        """
+        Same as wf_closure, but from the squared radii given by r2_closure
+        """
+        return -alpha * r2
+
+    def prob_from_r2(self, r2, alpha):
+        """
+        Same as prob_closure, but from the squared radii given by r2_closure
+        """
+        return 2 * self.wf_from_r2(r2, alpha)
+
+    def laplacian_from_sq_norm(self, sq_norm, alpha):
+        """
+        Analytical laplacian summed over the particles, from the unweighted squared norms x^2 + y^2 + z^2 of each
+        particle. Unlike wf_from_r2 and prob_from_r2, this does not take the beta weighted r2_closure (or State.r2)
+        """
+        # For a Gaussian wavefunction in log domain, the Laplacian is simply 4*alpha^2*r_i^2 - 2*alpha*d per particle,
+        # where d is the number of dimensions. Summed over the particles this only needs the total sum(r^2).
+        N = sq_norm.shape[0]
+
+        return 4 * alpha * alpha * self.backend.sum(sq_norm) - 2 * alpha * self._dim * N
 
     def uprime(self, rij):
         return self.radius / (rij ** 2 - self.radius * rij)
@@ -329,7 +494,7 @@ class VMC:
     def u_double_prime(self, rij):
         return self.radius * (self.radius - 2 * rij) / ((rij ** 2 - self.radius * rij) ** 2)
 
-    def anal_laplacian_closure_int(self, r, alpha):
+    def anal_laplacian_closure_int(self, r, alpha, beta):
         """Something something soon easter boys - this should take osme arguments and return some value? 
         """
         
@@ -339,8 +504,8 @@ class VMC:
         r_dist = self.state.positions - r + 1e-8
         r_dist = jnp.delete(r_dist, k_indx, axis=0)
         x, y, z = r
-        self.grad_phi = - 2 * alpha * jnp.array([x, y, self.beta * z])
-        self.grad_phi_square = 4 * alpha ** 2 * (x ** 2 + y ** 2 + self.beta ** 2 * z ** 2) - 2 * alpha * (self.beta + 2)
+        self.grad_phi = - 2 * alpha * jnp.array([x, y, beta * z])
+        self.grad_phi_square = 4 * alpha ** 2 * (x ** 2 + y ** 2 + beta ** 2 * z ** 2) - 2 * alpha * (beta + 2)
         # if jnp.any(np.abs(self.k_distances) < self.radius):
         #     breakpoint()
         
@@ -357,24 +522,6 @@ class VMC:
         return self.anal_laplacian
 
 
-    def laplacian_closure_jax(self, r, alpha):
-      
-        """
-        Computes the Laplacian of the wavefunction for each particle using JAX automatic differentiation.
-        r: Position array of shape (n_particles, n_dimensions)
-        alpha: Parameter(s) of the wavefunction
-        """
-        # Compute the Hessian (second derivative matrix) of the wavefunction
-        hessian_psi = jax.hessian(self.wf, argnums=0)           # The hessian matrix for our wavefunction
-        d = self._dim
-
-        r = r.reshape(1,d)        
-        first_term = jnp.trace(hessian_psi(r)[0].reshape(d, d))         # The hessian is nested like a ... onio
-        second_term = jnp.sum(self.grad_wf_closure(r, alpha) ** 2)
-        laplacian = first_term + second_term
-        
-        return laplacian
-
     def _initialize_vars(self, nparticles, dim, log, logger, logger_level):
         """Initializing the parameters in the VMC instance
         """
@@ -393,15 +540,15 @@ class VMC:
         self._logger_level = logger_level
         
         # Generate initial positions randomly
-        # Note: We split the RNG key to ensure subsequent uses of RNG don't reuse the same state.
-        key, subkey = random.split(self.rng)
-        initial_positions = random.normal(subkey, (nparticles, dim))  # Using JAX for random numbers
+        # Note: We take a fresh key from the pool to ensure subsequent uses of RNG don't reuse the same state.
+        initial_positions = random.normal(self.next_key(), (nparticles, dim))  # Using JAX for random numbers
         # Initialize logp, assuming a starting value or computation
         a = self.params.get("alpha")  # Using Parameter.get to access alpha
         initial_logp = 0 # self.prob_closure(initial_positions , a)  # Now I use the log of the modulus of wave function, can be changed
 
         
-        self.state = State(positions=initial_positions, logp=initial_logp , n_accepted= 0 , delta = 0)
+        self.state = State(positions=initial_positions, logp=initial_logp , n_accepted= 0 , delta = 0,
+                           r2=self.r2_closure(initial_positions))
         self.state.r_dist = initial_positions[None, ...] - initial_positions[:, None, :]
         
 
@@ -409,9 +556,19 @@ class VMC:
         # Initialize variational parameters in the correct range with the correct shape
         # Take a look at the qs.utils.Parameter class. You may or may not use it depending on how you implement your code.
         # Here, we initialize the variational parameter 'alpha'.
-        if alpha:
-            initial_params = {"alpha": jnp.array([alpha])}
-        else:
-            initial_params = {"alpha": jnp.array([0.5])}  # Example initial value for alpha ( 1 paramter)
-        self.params = Parameter(initial_params)  # I still do not understand what should be the alpha dim
-        pass 
+        # alpha is a single number, so it is stored with shape () rather than (1,) to avoid broadcasting a length-1 axis
+        # everywhere it is used.
+        # If more variational parameters are added, they should get their own vector (e.g. "alphas").
+        initial_params = {"alpha": jnp.asarray(alpha if alpha else 0.5)}  # Example initial value for alpha ( 1 paramter)
+        self.params = Parameter(initial_params)
+        self._alpha = self.backend.asarray(initial_params["alpha"])
+
+    def set_alpha(self, alpha):
+        """Update the variational parameter alpha.
+
+        The helpers (wf, prob, grad_wf, ...) read the cached self._alpha instead of looking it up in self.params
+        on every call, so alpha should always be updated through here to keep the two in sync.
+        The cached copy is an array of the VMC backend, so the numpy backend never dispatches jax work through alpha.
+        """
+        self.params.set("alpha", alpha)
+        self._alpha = self.backend.asarray(alpha) 
@@ -48,15 +48,20 @@ class QS:
         radius = None,
         time_step=None,
         diffusion_coeff=None,
-        type_hamiltonian = "ho"
+        type_hamiltonian = "ho",
+        precision="fp64",
     ):
         """Quantum State
         It is conceptually important to understand that this is the system.
         The system is composed of a wave function, a hamiltonian, a sampler and an optimizer.
         This is the high level class that ties all the other classes together.
+
+        precision is either "fp64" or "fp32". With "fp32" and the jax backend, the scanned training runs in single
+        precision, while alpha outside of train, the final alpha and all other sampling stay in double precision.
         """
 
         self._check_logger(log, logger_level)
+        self._check_precision(precision)
         self.backend = backend
 
         self._log = log
@@ -80,8 +85,12 @@ class QS:
         self.time_step = time_step
         self.diffusion_coeff = diffusion_coeff
         self.type_hamiltonian = type_hamiltonian
-
-
+        self._precision = precision
+        # Only the jax training graph is cast to single precision, x64 itself stays enabled for everything else
+        self._train_dtype = jnp.float32 if precision == "fp32" else None
+        if self._train_dtype is not None and backend != "jax":
+            warnings.warn("precision='fp32' only applies to the jax backend, training runs in fp64")
+            self._train_dtype = None
 
         if rng is None:
             # If no RNG is provided but a seed is, initialize a new RNG with the seed.
@@ -110,6 +119,7 @@ class QS:
         self._is_initialized_ = False
         self._is_trained_ = False
         self._sampling_performed = False
+        self._train_chunk = None  # Compiled training scan, see _train_scan
 
     def set_wf(self, wf_type, nparticles, dim, **kwargs):
         """
@@ -136,10 +146,7 @@ class QS:
             beta=self.beta,
             radius = self.radius
         )
-        # Initialize the parameters for the VMC class wavefunction, and set the alpha parameter from config.py
-        self.alg._initialize_vars(
-            self._N, self._dim, self._log, self.logger, self.logger_level)
-        
+        # VMC.__init__ already initializes the variational parameters and the state (positions, logp, ...)
         self.alpha = self.alg.params.get("alpha")           # This should not be necessary, alpha gets picked out in the .wf
                                                             # Meaning we could save it inside the .wf function as self.alpha, and call it as self.alg.alpha. 
                                                             # Would it save us some time? No clue, atleast it reduces the need to call the config file.
@@ -196,6 +203,7 @@ class QS:
         """
         self.mcmc_alg = mcmc_alg
         self._scale = scale
+        self._train_chunk = None  # The compiled training scan traces the sampler
         vmc_instance = self.alg
         hami = self.hamiltonian
 
@@ -241,16 +249,24 @@ class QS:
         Set the optimizer algorithm to be used for param update.
         """
         self._eta = eta
+        self._train_chunk = None  # The compiled training scan traces the optimizer step
         if optimizer == "gd":
             self._optimizer = gd_opt(eta=eta)
         else:
             raise ValueError("Invalid optimizer type, should be 'gd'")
 
+        if self._backend == "jax":
+            # The update is a pure function of (params, grads), so it runs as a compiled op on device
+            self._optimizer.step = jax.jit(self._optimizer.step)
+
     # This should be jittable, but this will be looked at when we start working on training.
-    def train(self, max_iter, batch_size, seed, tol=1e-6, **kwargs):
+    def train(self, max_iter, batch_size, seed, tol=1e-6, eval_interval=10, **kwargs):
         """
         Train the wave function parameters.
         Here you should calculate sampler statistics and update the wave function parameters based on the derivative of the (statistical) local energy.
+
+        When the sampler runs its chains with lax.scan, the training iterations are scanned as well and Python is only
+        re-entered every eval_interval iterations to update the progress bar.
         """
         self._is_initialized()
         self._training_cycles = max_iter
@@ -276,47 +292,131 @@ class QS:
                 position=0,
                 leave=True, 
                 colour="green") as pbar:
-            for iteration in range(max_iter):
-
-                # Sample data in batches
-                _, sampled_positions, local_energies = self.sample(
-                    nsamples=batch_size, nchains=1, seed=seed
-            )
+            if self._train_dtype is not None and not self.sampler._use_scan:
+                warnings.warn("precision='fp32' only applies to the scanned training, training runs in fp64")
+            if self.sampler._use_scan:
+                alphas, cycles = self._train_scan(max_iter, batch_size, eval_interval, pbar)
+            else:
+                for iteration in range(max_iter):
+
+                    # Sample data in batches
+                    _, sampled_positions, local_energies = self.sample(
+                        nsamples=batch_size, nchains=1, seed=seed
+                )
                 
-                # sampled positions if of shape (batch_size, nparticles, dim)
-                grads = (self.alg.grads(sampled_positions))
-                first_term = self.backend.mean(grads.reshape(self._training_batch, 1) * local_energies.reshape(self._training_batch, 1))
-                second_term = self.backend.mean(grads) * self.backend.mean(local_energies)
-                grads_alpha = 2 * (first_term - second_term)
+                    # sampled positions if of shape (batch_size, nparticles, dim)
+                    grads = (self.alg.grads(sampled_positions))
+                    first_term = self.backend.mean(grads.reshape(self._training_batch, 1) * local_energies.reshape(self._training_batch, 1))
+                    second_term = self.backend.mean(grads) * self.backend.mean(local_energies)
+                    grads_alpha = 2 * (first_term - second_term)
                 
-                alphas.append(self.alpha)
-                cycles.append(iteration)
-                # Ensure alpha and its gradient are iterables
-                self.alpha = self.backend.array(
-                    self._optimizer.step([self.alpha], [grads_alpha])
-                )[0]
+                    alphas.append(self.alpha)
+                    cycles.append(iteration)
+                    # Ensure alpha and its gradient are iterables. With jax the step returns device arrays, so alpha
+                    # stays on device, with numpy it is brought back to host so the numpy sampler stays pure numpy
+                    self.alpha = self._optimizer.step([self.alpha], [grads_alpha])[0]
+                    if self._backend == "numpy":
+                        self.alpha = np.asarray(self.alpha)
                 
-                # Update the progressbar to show the current alpha value
-                pbar.set_description(rf"[Training progress, alpha={float(self.alpha):.4f}]")
-                pbar.update(1)
-                # Update the alpha in the Parameter instance
-                old_alpha = self.alg.params.get("alpha")
-                diff_alpha = np.abs(old_alpha - self.alpha)
-                if diff_alpha < tol:
-                    pass
-                    # print(f"Converged after {iteration} iterations")
-                    # break
-                self.alg.params.set("alpha", self.alpha)
+                    # Update the progressbar to show the current alpha value
+                    pbar.set_description(rf"[Training progress, alpha={float(self.alpha):.4f}]")
+                    pbar.update(1)
+                    # Update the alpha in the Parameter instance
+                    old_alpha = self.alg.params.get("alpha")
+                    diff_alpha = np.abs(old_alpha - self.alpha)
+                    if diff_alpha < tol:
+                        pass
+                        # print(f"Converged after {iteration} iterations")
+                        # break
+                    self.alg.set_alpha(self.alpha)
                 
         self.sampler._log = True        # Show the sampling progress after the training has finished
         self._is_trained_ = True
-        print("Alpha after training", self.alg.params.get("alpha"))
+
+        print("Alpha after training", np.asarray(self.alpha))
 
         if self.logger is not None:
             self.logger.info("Training done")
 
         return alphas , cycles
 
+    def _train_scan(self, max_iter, batch_size, eval_interval, pbar):
+        """
+        Training loop of train as a jax.lax.scan over the iterations: sample a batch, compute the alpha gradient and take
+        an optimizer step, all in one compiled graph. The scan runs in chunks of eval_interval iterations to report progress.
+
+        The compiled scan is built once per instance and reused by later calls to train. jit only retraces it for a new
+        batch_size or chunk length, and a shorter last chunk is padded with inactive iterations instead.
+        """
+        alpha, state = self.alpha, self.alg.state
+        if self._train_dtype is not None:
+            # Single precision copies of alpha and the positions for the scan, self.alpha keeps its full precision
+            alpha = jnp.asarray(alpha, dtype=self._train_dtype)
+            positions = jnp.asarray(state.positions, dtype=self._train_dtype)
+            state = State(positions, state.logp, state.n_accepted, state.delta, r2=self.alg.r2_closure(positions))
+        chain_state = self.sampler._scan_state(state, alpha)
+
+        if self._train_chunk is None:
+            self._train_chunk = jax.jit(lambda carry, xs: jax.lax.scan(self._train_step, carry, xs))
+
+        carry = (chain_state, alpha)
+        alphas = []
+        # Every chunk has the same length, so the compiled scan is reused for the last one as well
+        chunk_len = min(eval_interval, max_iter)
+        shape = (chunk_len, batch_size, self._N, self._dim)
+        for start in range(0, max_iter, eval_interval):
+            n_iter = min(eval_interval, max_iter - start)
+            noise = self.alg.generate_normal_block(chunk_len * batch_size, self._N, self._dim).reshape(shape)
+            if self._train_dtype is not None:
+                noise = noise.astype(self._train_dtype)
+            keys = self.alg.prime_keys(chunk_len * batch_size)
+            keys = keys.reshape(chunk_len, batch_size, *keys.shape[1:])
+            active = np.arange(chunk_len) < n_iter
+
+            carry, chunk_alphas = self._train_chunk(carry, (noise, keys, active))
+            # One host transfer per chunk, the padded iterations are dropped
+            alphas.extend(np.asarray(chunk_alphas)[:n_iter])
+
+            # Update the progressbar to show the current alpha value
+            pbar.set_description(rf"[Training progress, alpha={float(carry[1]):.4f}]")
+            pbar.update(n_iter)
+
+        chain_state, alpha = carry
+        if self._train_dtype is not None:
+            # Back to double precision, so the final energy is estimated in fp64
+            alpha = jnp.asarray(alpha, dtype=jnp.float64)
+            positions = jnp.asarray(chain_state.positions, dtype=jnp.float64)
+            chain_state = State(positions, chain_state.logp, chain_state.n_accepted, chain_state.delta,
+                                r2=self.alg.r2_closure(positions))
+        self.alpha = alpha
+        self.alg.set_alpha(self.alpha)
+        # logp of the final state is recomputed for the last update of alpha
+        self.alg.state = State(chain_state.positions, self.alg.prob_from_r2(chain_state.r2, self.alpha),
+                               chain_state.n_accepted, chain_state.delta, r2=chain_state.r2)
+
+        return alphas, list(range(max_iter))
+
+    def _train_step(self, carry, xs):
+        """One training iteration of _train_scan, as the lax.scan body.
+
+        An inactive iteration (padding of the last chunk) leaves the carry unchanged.
+        """
+        chain_state, alpha = carry
+        noise, keys, active = xs
+        chain_state, (sampled_positions, local_energies) = self.sampler.run_chain(chain_state, noise, keys, alpha)
+
+        grads = self.alg.grads_closure(sampled_positions, alpha, self.alg.beta)
+        first_term = jnp.mean(grads * local_energies)
+        second_term = jnp.mean(grads) * jnp.mean(local_energies)
+        grads_alpha = 2 * (first_term - second_term)
+
+        new_alpha = self._optimizer.step([alpha], [grads_alpha])[0]
+        # The scan carry must keep its dtypes, so anything promoted by a float64 constant is cast back
+        new_carry = jax.tree_util.tree_map(
+            lambda new, old: jnp.where(active, new.astype(old.dtype), old), (chain_state, new_alpha), carry
+        )
+        return new_carry, alpha
+
     def sample(self, nsamples, nchains=1, seed=None):
         """helper for the sample method from the Sampler class"""
         self._is_initialized()  # check if the system is initialized
@@ -335,7 +435,12 @@ class QS:
             nsamples, nchains
         )
         system_info = pd.DataFrame(system_info, index=[0])
-        sample_results = pd.DataFrame(sample_results, index=[0])
+        # The statistics stay on device until here, the DataFrame is the only place they are needed on host.
+        # With several chains the sampler already returns one row per chain, a single chain returns its results dict
+        if isinstance(sample_results, pd.DataFrame):
+            sample_results = sample_results.reset_index(drop=True)
+        else:
+            sample_results = self.sampler._results_frame([sample_results])
         system_info_repeated = system_info.loc[
             system_info.index.repeat(len(sample_results))
         ].reset_index(drop=True)
@@ -352,7 +457,7 @@ class QS:
         Return:(X_boot_mean) retunrns the mean of the bootstrapped input array
         """
 
-        self.X = np.array(X)
+        self.X = np.asarray(X)
         nstraps = len(X)
 
         #breakpoint()
@@ -395,7 +500,7 @@ class QS:
         Return: mean of all bootstrap means
         """
         self._n = n
-        self._X =self.backend.array( X)
+        self._X = self.backend.asarray(X)  # X is usually the local energies array already, asarray avoids a copy
         meanE = []
         varE = []
 
@@ -461,6 +566,10 @@ class QS:
             msg = "A call to 'sample' must be made in order to access results"
             raise errors.SamplingNotPerformed(msg)
 
+    def _check_precision(self, precision):
+        if precision not in ("fp64", "fp32"):
+            raise ValueError("Invalid precision, should be 'fp64' or 'fp32':", precision)
+
     def _check_logger(self, log, logger_level):
         if not isinstance(log, bool):
             raise TypeError("'log' must be True or False")
@@ -4,6 +4,7 @@ from typing import Iterable
 from typing import Mapping
 from typing import Union
 
+import jax
 import jax.numpy as jnp
 import numpy as np
 from simulation_scripts import config
@@ -18,6 +19,7 @@ PyTree = Union[
 from dataclasses import dataclass
 
 
+@jax.tree_util.register_pytree_node_class
 @dataclass(frozen=False)
 class State:
     positions: PyTree
@@ -25,9 +27,10 @@ class State:
     n_accepted: int
     delta: int
 
-    def __init__(self, positions, logp, n_accepted=0, delta=0):
+    def __init__(self, positions, logp, n_accepted=0, delta=0, r2=None):
         self.positions = positions
         self.r_dist = self.positions[None, ...] - self.positions[:, None, :]
+        self.r2 = r2  # squared radius of each particle, see VMC.r2_closure
         self.logp = logp
         self.n_accepted = n_accepted
         self.delta = delta
@@ -44,6 +47,22 @@ class State:
             case _: # noqa
                 raise ValueError("Invalid backend:", backend)
 
+    def tree_flatten(self):
+        """The arrays of the state are its pytree leaves, so a State can be carried through jax.lax.scan, jit and vmap"""
+        return (self.positions, self.logp, self.n_accepted, self.delta, self.r2), None
+
+    @classmethod
+    def tree_unflatten(cls, aux_data, children):
+        # jax may unflatten with placeholders that are not arrays, so this skips __init__ and only sets the leaves.
+        # Use rebuild to get r_dist and the backend back once the state is out of the jax transformation
+        state = object.__new__(cls)
+        state.positions, state.logp, state.n_accepted, state.delta, state.r2 = children
+        return state
+
+    def rebuild(self):
+        """Full State, with r_dist and backend, from one that came out of a jax transformation (see tree_unflatten)"""
+        return State(*self.tree_flatten()[0])
+
     def create_batch_of_states(self, batch_size):
         """
         # TODO: check if batch states are immutable because of the jnp
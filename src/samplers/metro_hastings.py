@@ -1,13 +1,12 @@
+import warnings
+
 import jax.numpy as jnp
 import numpy as np
-from jax import jit, ops
-from jax import lax
-import jax.random as random
-from qs.utils import State
-from qs.utils import advance_PRNG_state
+from jax import jit
 from .sampler import Sampler
 from qs.models.vmc import VMC
 from qs.utils.parameter import Parameter
+from simulation_scripts import config
 
 
 class MetropolisHastings(Sampler):
@@ -28,8 +27,13 @@ class MetropolisHastings(Sampler):
         diffusion_coeff=0.5,
     ):
 
+        if config.single_particle:
+            warnings.warn("single_particle is only supported by the Metropolis sampler, all particles are moved at once")
         self.time_step = time_step
         self.diffusion_coeff = diffusion_coeff
+        # Constants of the scan step as jnp scalars, precomputed once instead of in every trace
+        self._sqrt_time_step = jnp.sqrt(jnp.asarray(time_step))
+        self._drift = jnp.asarray(diffusion_coeff * time_step)
         self._seed = seed
         self._N = n_particles
         self._dim = dim
@@ -56,25 +60,20 @@ class MetropolisHastings(Sampler):
         self.importance_sampling_interior = jit(self.importance_sampling_interior)
     
     
-    def step(self, wf_squared, state, seed):
-        """One step of the importance sampling Metropolis-Hastings algorithm."""
+    def step(self, wf_squared_pair, state, noise, u):
+        """One step of the importance sampling Metropolis-Hastings algorithm, with the noise and uniforms of this step
+        from draw_randoms."""
         initial_positions = state.positions
         quantum_force_init = 2 * self.alg_inst.grad_wf(initial_positions)
         # Use the current positions to generate the quantum force
-        # Generate a proposal move
-        next_gen = advance_PRNG_state(seed, state.delta)
-        rng = self._rng(next_gen)
-        
-        # Generate a proposal move
-        eta = rng.normal(loc=0, scale=1, size=(self._N, self._dim))
-        proposed_positions = (
-            initial_positions
-            + self.diffusion_coeff * quantum_force_init * self.time_step
-            + eta * (self.backend.sqrt(self.time_step))
-        )
+        # Generate a proposal move. The affine transform of the standard normal draw is done in place on eta,
+        # a fresh array every step (noise is a view into the draws of the whole chain), instead of one temporary per term
+        eta = noise * np.sqrt(self.time_step)
+        eta += self.diffusion_coeff * self.time_step * quantum_force_init
+        eta += initial_positions
+        proposed_positions = eta
         # Calculate wave function squared for current and proposed positions
-        prob_current = wf_squared(initial_positions)
-        prob_proposed = wf_squared(proposed_positions)
+        prob_current, prob_proposed = wf_squared_pair(initial_positions, proposed_positions)
         
         # Calculate the q - value
         q_value, proposed_positions = self.importance_sampling_interior(initial_positions,
@@ -83,9 +82,12 @@ class MetropolisHastings(Sampler):
                                                                         prob_current,
                                                                         prob_proposed,
                                                                         self.diffusion_coeff,
-                                                                        self.time_step)
+                                                                        self.time_step,
+                                                                        self.alg_inst._alpha)
         # Decide on acceptance
-        accept = rng.random(self._N) < self.backend.exp(q_value)
+        # In log domain, as exp(q_value) can overflow. The test runs on host like the accept, so the jax loop path
+        # does not dispatch an eager jnp.log per step
+        accept = np.log(u) < np.asarray(q_value)
         accept = accept.reshape(-1, 1)
         # Update positions based on acceptance
         new_positions, new_logp, n_accepted = self.accept_func(
@@ -105,6 +107,34 @@ class MetropolisHastings(Sampler):
 
         #breakpoint()
 
+    def step_pure(self, state, noise, key, alpha):
+        """One step of the importance sampling Metropolis-Hastings algorithm as a pure function, used as the lax.scan body.
+
+        state: State carried by the scan (see Sampler._scan_state). Its r2 are the squared radii of the current positions
+        (see VMC.r2_closure), which do not depend on alpha and are therefore carried instead of logp
+        noise: (N, dim) standard normal draws for the proposal of this step
+        key: PRNG key for the accept draws of this step
+        """
+        initial_positions = state.positions
+        quantum_force_init = 2 * self.alg_inst.grad_wf_closure(initial_positions, alpha, self.alg_inst.beta)
+        # Generate a proposal move
+        proposed_positions = (
+            initial_positions
+            + self._drift * quantum_force_init
+            + noise * self._sqrt_time_step
+        )
+        r2_proposed, prob_current, prob_proposed = self._proposal_probs(state.r2, proposed_positions, alpha)
+
+        q_value, proposed_positions = self.importance_sampling_interior(initial_positions,
+                                                                        proposed_positions,
+                                                                        quantum_force_init,
+                                                                        prob_current,
+                                                                        prob_proposed,
+                                                                        self.diffusion_coeff,
+                                                                        self.time_step,
+                                                                        alpha)
+
+        return self._accept_pure(state, key, q_value, proposed_positions, r2_proposed, prob_current, prob_proposed)
 
     def importance_sampling_interior(self,
                                      initial_positions,
@@ -113,9 +143,10 @@ class MetropolisHastings(Sampler):
                                      prob_init,
                                      prob_proposed,
                                      D,
-                                     dt):
+                                     dt,
+                                     alpha):
         
-        q_force_proposed = 2 * self.alg_inst.grad_wf(proposed_positions)
+        q_force_proposed = 2 * self.alg_inst.grad_wf_closure(proposed_positions, alpha, self.alg_inst.beta)
         
         # Calculate wave function squared for current and proposed positions
         
@@ -138,9 +169,11 @@ class MetropolisHastings(Sampler):
         log_psi_current,
         log_psi_proposed,
     ):
-        # accept is a boolean array, so you can use it to index directly
+        # accept is a boolean (N, 1) array, so it broadcasts against the (N, dim) positions row by row.
+        # This only runs in the eager Python loop, so numpy is used for both backends to avoid per-call device dispatches
         new_positions = np.where(accept, proposed_positions, initial_positions)
-        new_logp = np.where(accept, log_psi_proposed, log_psi_current)
+        # logp is (N,), so accept is flattened to match it instead of broadcasting to an (N, N) array
+        new_logp = np.where(accept.ravel(), log_psi_proposed, log_psi_current)
 
         # Count the number of accepted moves
         n_accepted += np.sum(accept)
@@ -1,13 +1,11 @@
+import warnings
+
 import jax.numpy as jnp
 import numpy as np
-from jax import jit, ops
-from jax import lax
-import jax.random as random
-from qs.utils import State
-from qs.utils import advance_PRNG_state
 from .sampler import Sampler
 from qs.models.vmc import VMC
 from qs.utils.parameter import Parameter
+from simulation_scripts import config
 
 
 class Metropolis(Sampler):
@@ -24,52 +22,175 @@ class Metropolis(Sampler):
         logger=None,
         logger_level="INFO",
         backend="Numpy",
+        accept_dtype=jnp.float32,
     ):
         # Initialize the VMC instance
         # Initialize Metropolis-specific variables
-        self.step_method = self.step
+        # The accept test only has to decide a "<", so log_accept_prob and the uniform draws are compared in
+        # accept_dtype. The positions and log probabilities themselves keep their own precision
+        self._accept_dtype = accept_dtype
+        # The accept is only called by the Python loop, which runs eagerly, so numpy is used for both backends.
+        # Eager jnp calls would add a device dispatch per operation on every step
+        self.accept_func = self.accept_numpy
         self._seed = seed
         self._N = n_particles
         self._dim = dim
         super().__init__(alg_inst, hamiltonian, log, rng, scale, logger, backend)
+        # jnp scalar for the scan step, so the proposal is traced with an array constant rather than a captured Python
+        # float. It is weakly typed, so it follows the dtype of the noise
+        self._scale = jnp.asarray(scale)
+
+        # The step is specialized once here, after the Sampler has set scale and rng.
+        # Single particle moves are only used by the Python loop, the scan path keeps moving all particles at once
+        if config.single_particle and self._use_scan:
+            warnings.warn("single_particle is not supported by the scan path (jax without interaction), "
+                          "all particles are moved at once")
+        self._single_particle = config.single_particle and not self._use_scan
+        if self._single_particle:
+            self.step = self._build_single_particle_step()
+            self._moves_per_step = 1
+        else:
+            self.step = self._build_step()
+        self.step_method = self.step
+
+    def _build_step(self):
+        """Build the random walk Metropolis step used by the Python sampling loop.
+
+        The step runs nsamples times per sample call, so the attributes it needs are looked up once here
+        and bound as locals of the returned closure instead of on every call.
+        """
+        scale = self.scale
+        accept_func = self.accept_func
+        log = np.log  # Refrain from using Jax function outside jitcompiled code
+        less = np.less
+        where = np.where
+        accept_dtype = self._accept_dtype
+        alg = self.alg
+        # Without interaction the log probability only depends on the squared radii, so the ones of the current
+        # positions are carried in state.r2 (as in step_pure) and only the proposal has to be evaluated
+        use_r2 = not alg._interacting
+
+        # Scratch buffers for the proposal and the accept draws, reused by every step instead of allocating new ones.
+        # new_positions is still a fresh array, since the sampling loop keeps a reference to the positions of every step.
+        # jax may hold on to a numpy input without copying it, so with the jax backend every step gets new buffers
+        def new_buffers():
+            return np.empty((self._N, self._dim)), np.empty(self._N, dtype=accept_dtype), np.empty(self._N, dtype=bool)
+
+        reuse_buffers = self._backend == "numpy"
+        buffers = new_buffers()
+
+        def step(wf_squared_pair, state, noise, u):
+            """One step of the random walk Metropolis algorithm, with the noise and uniforms of this step from draw_randoms.
+
+            wf_squared_pair is only called for the interacting wavefunction.
+            """
+            initial_positions = state.positions
+            proposal, log_u, accept = buffers if reuse_buffers else new_buffers()
+            # Generate a proposal move, written into the proposal buffer
+            np.multiply(noise, scale, out=proposal)
+            proposal += initial_positions
+            proposed_positions = proposal
+            # Calculate log probability densities for current and proposed positions
+            if use_r2:
+                r2_proposed = alg.r2_closure(proposed_positions)
+                prob_current = alg.prob_from_r2(state.r2, alg._alpha)
+                prob_proposed = alg.prob_from_r2(r2_proposed, alg._alpha)
+            else:
+                prob_current, prob_proposed = wf_squared_pair(initial_positions, proposed_positions)
+            # Calculate acceptance probability in log domain. The difference is taken at full precision, before the cast
+            log_accept_prob = np.asarray(prob_proposed - prob_current, dtype=accept_dtype)
+            # Decide on acceptance, compared in log domain so exp(log_accept_prob) can not overflow
+            log(u, out=log_u)
+            less(log_u, log_accept_prob, out=accept)
+            new_positions, new_logp, n_accepted = accept_func(
+                n_accepted=state.n_accepted,
+                accept=accept.reshape(-1, 1),
+                initial_positions=initial_positions,
+                proposed_positions=proposed_positions,
+                log_psi_current=prob_current,
+                log_psi_proposed=prob_proposed,
+            )
+
+            # Create new state by updating state variables.
+            if use_r2:
+                state.r2 = where(accept, r2_proposed, state.r2)
+            state.logp = new_logp
+            state.n_accepted = n_accepted
+            state.delta += 1
+            state.positions = new_positions
+            state.r_dist = new_positions[None, ... ] - new_positions[:, None, :]
+
+        return step
 
-    def step(self, wf_squared, state, seed):
-        """One step of the random walk Metropolis algorithm."""
-        initial_positions = state.positions
-        next_gen = advance_PRNG_state(seed, state.delta)
-        rng = self._rng(next_gen)
+    def _build_single_particle_step(self):
+        """Build the single particle random walk Metropolis step used by the Python sampling loop.
+
+        Every step moves one randomly chosen particle. Its acceptance only needs that particle's row of the
+        pair distances (see VMC.wf_squared_ratio), which is O(N) per step for the interacting wavefunction.
+        The accept is a Python branch, so the step runs on host numpy arrays for both backends, instead of syncing
+        with the device on every step.
+        state.logp is not updated by this step. Nothing on the loop path reads it, and Sampler._scan_state recomputes
+        it from state.r2 when a scan starts from this state.
+        """
+        scale = self.scale
+        alg = self.alg
+        log = np.log
+        beta2 = alg.beta**2
+        # alpha only changes between sample calls (VMC.set_alpha), so its host copy is only refreshed when it does
+        alpha_src, alpha = None, None
+
+        def step(wf_squared_pair, state, i, noise, u):
+            """One step of the single particle random walk Metropolis algorithm, moving particle i (see draw_randoms)."""
+            nonlocal alpha_src, alpha
+            if alg._alpha is not alpha_src:
+                alpha_src, alpha = alg._alpha, np.asarray(alg._alpha)
+            positions = np.asarray(state.positions)
+            delta = scale * noise
+            log_accept_prob = alg.wf_squared_ratio(positions, i, delta, alpha=alpha, backend=np)
+
+            # Decide on acceptance, compared in log domain so exp(log_accept_prob) can not overflow
+            if log(u) < log_accept_prob:
+                # A fresh array, since the sampling loop keeps a reference to the positions of every step
+                new_positions = np.array(positions)
+                new_positions[i] += delta
+                # Only the squared radius of particle i changes, see VMC.r2_closure
+                r2 = np.array(state.r2)
+                r2[i] = beta2 * new_positions[i, 0] ** 2 + new_positions[i, 1:] @ new_positions[i, 1:]
+                state.positions = new_positions
+                state.r_dist = new_positions[None, ... ] - new_positions[:, None, :]
+                state.r2 = r2
+                state.n_accepted += 1
+            state.delta += 1
+
+        return step
+
+    def draw_randoms(self, rng, nsamples):
+        """Same as Sampler.draw_randoms, with the uniforms in accept_dtype.
+
+        For single particle moves every step instead gets the index of the particle to move, dim normals and one uniform.
+        """
+        if self._single_particle:
+            return rng.integers(self._N, size=nsamples), rng.standard_normal((nsamples, self._dim)), rng.random(nsamples)
+
+        return rng.standard_normal((nsamples, self._N, self._dim)), rng.random((nsamples, self._N), dtype=self._accept_dtype)
+
+    def step_pure(self, state, noise, key, alpha):
+        """One step of the random walk Metropolis algorithm as a pure function, used as the lax.scan body.
+
+        state: State carried by the scan (see Sampler._scan_state). Its r2 are the squared radii of the current positions
+        (see VMC.r2_closure), which do not depend on alpha and are therefore carried instead of logp
+        noise: (N, dim) standard normal draws for the proposal of this step
+        key: PRNG key for the accept draws of this step
+        """
         # Generate a proposal move
-        proposed_positions = rng.normal(loc=initial_positions, scale=self.scale)
-        # Calculate log probability densities for current and proposed positions
-        prob_current = wf_squared(initial_positions)
-        prob_proposed = wf_squared(proposed_positions)
-        # Calculate acceptance probability in log domain
-        log_accept_prob = prob_proposed - prob_current
-        # Decide on acceptance
-        # accept = rng.random(initial_positions.shape[0]) < self.backend.exp(log_accept_prob)
-        accept = rng.random(initial_positions.shape[0]) < np.exp(log_accept_prob)  # Refrain from using Jax function outside jitcompiled code
-        accept = accept.reshape(-1, 1)
-        new_positions, new_logp, n_accepted = self.accept_func(
-            n_accepted=state.n_accepted,
-            accept=accept,
-            initial_positions=initial_positions,
-            proposed_positions=proposed_positions,
-            log_psi_current=prob_current,
-            log_psi_proposed=prob_proposed,
-        )
-
-
-
-        # Create new state by updating state variables.
-        state.logp = new_logp
-        state.n_accepted = n_accepted
-        state.delta += 1
-        state.positions = new_positions
-        state.r_dist = new_positions[None, ... ] - new_positions[:, None, :]
-
-        #breakpoint()
-
-    def accept_func(
+        proposed_positions = state.positions + self._scale * noise
+        r2_proposed, prob_current, prob_proposed = self._proposal_probs(state.r2, proposed_positions, alpha)
+        # The difference is taken at full precision, only the accept test runs in accept_dtype
+        log_accept_prob = (prob_proposed - prob_current).astype(self._accept_dtype)
+
+        return self._accept_pure(state, key, log_accept_prob, proposed_positions, r2_proposed, prob_current, prob_proposed)
+
+    def accept_numpy(
         self,
         n_accepted,
         accept,
@@ -78,11 +199,13 @@ class Metropolis(Sampler):
         log_psi_current,
         log_psi_proposed,
     ):
-        # accept is a boolean array, so you can use it to index directly
+        """Vectorized accept/reject of the per-particle moves, accept is a boolean (N, 1) array"""
+        # accept broadcasts against the (N, dim) positions, so every particle row is selected in one call
         new_positions = np.where(accept, proposed_positions, initial_positions)
-        new_logp = np.where(accept, log_psi_proposed, log_psi_current)
+        # logp is (N,), so accept is flattened to match it instead of broadcasting to (N, N)
+        new_logp = np.where(accept.ravel(), log_psi_proposed, log_psi_current)
 
         # Count the number of accepted moves
-        n_accepted += np.sum(accept)
+        n_accepted += int(accept.sum())
 
         return new_positions, new_logp, n_accepted
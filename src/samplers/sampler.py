@@ -2,6 +2,7 @@ import copy
 
 import jax
 import jax.numpy as jnp
+import jax.random as random
 import numpy as np
 import pandas as pd
 from qs.utils import (
@@ -31,6 +32,7 @@ class Sampler:
         self.hami = hamiltonian
         self.step_method = None
         self.n_training_cycles = config.training_cycles
+        self._moves_per_step = alg._N  # Number of single particle moves proposed per step, for the acceptance rate
         match backend:
             case "numpy":
                 self.backend = np
@@ -44,6 +46,18 @@ class Sampler:
             case _:  # noqa
                 raise ValueError("Invalid backend:", backend)
 
+        # The whole chain can only be traced into a lax.scan when the wavefunction does not read the current state
+        self._use_scan = backend == "jax" and not alg._interacting
+        if self._use_scan:
+            # RNG, wavefunction, accept and local energy of every step compiled into one kernel. alpha is an argument,
+            # so the compiled chain is reused across training iterations as long as nsamples stays the same
+            self._run_chain_jit = jax.jit(self.run_chain)
+            # Same kernel with a leading chain axis on the carry, noise and keys, so all chains advance in lockstep
+            self._run_chains_jit = jax.jit(jax.vmap(self.run_chain, in_axes=(0, 0, 0, None)))
+            # With more than one device (e.g. XLA_FLAGS=--xla_force_host_platform_device_count=N on CPU),
+            # the chains are split over the devices and every device vmaps over its share
+            self._run_chains_pmap = jax.pmap(jax.vmap(self.run_chain, in_axes=(0, 0, 0, None)), in_axes=(0, 0, 0, None))
+
     def sample(self, nsamples, nchains=1, seed=None):
         """
         Will call _sample() and return the results
@@ -59,6 +73,11 @@ class Sampler:
                 nsamples, chain_id
             )
 
+        elif self._use_scan:
+            # The chains are vmapped into a single compiled kernel instead of running one process per chain
+            results, self._sampled_positions, self._local_energies = self._sample_chains(nsamples, nchains)
+            self._results = self._results_frame(results)
+
         else:
             multi_sampler = sampler_utils.multiproc
             results, self._sampled_positions, self._local_energies = multi_sampler(
@@ -67,7 +86,7 @@ class Sampler:
                 nchains, 
                 seeds
             )
-            self._results = pd.DataFrame(results)
+            self._results = self._results_frame(results)
 
         self._sampling_performed_ = True
         if self._logger is not None and self._log:
@@ -84,6 +103,60 @@ class Sampler:
             Seed for the random number generator. The default is self._seed (what was initialized in the system class).
             We need to able to set the seed for each chain in the sampling process, otherwise we will get the same results for each chain. 
         """
+        if self._use_scan:
+            sampled_positions, local_energies = self._sample_scan(nsamples)
+        else:
+            sampled_positions, local_energies = self._sample_loop(nsamples, chain_id, seed)
+
+        sample_results = self._chain_results(
+            chain_id, nsamples, self.alg.state.n_accepted, sampled_positions, local_energies
+        )
+
+        return sample_results, sampled_positions, local_energies
+
+    def _chain_results(self, chain_id, nsamples, n_accepted, sampled_positions, local_energies):
+        """Statistics of a single chain, shared by _sample and _sample_chains"""
+        # Calculate acceptance rate
+        # TODO: Should investigate more here
+        # n_accepted is an int32 counter on the scan path, dividing it by an int would promote to float32
+        n_accepted = self.backend.asarray(n_accepted, dtype=self.backend.float64)
+        if config.training_cycles != 0 and nsamples != 0:
+            acceptance_rate = n_accepted / (nsamples * self._moves_per_step * self.n_training_cycles)
+        else:
+            acceptance_rate = n_accepted / (nsamples * self._moves_per_step)
+        # acceptance_rate = self.alg.state.n_accepted / (nsamples * self.alg._N)
+        mean_positions = self.backend.mean(self.backend.abs(sampled_positions), axis=0)
+        # Compute statistics of local energies
+        mean_energy = self.backend.mean(local_energies)
+        std_error = self.backend.std(local_energies) / self.backend.sqrt(nsamples)
+        variance = self.backend.var(local_energies)
+        # calculate energy, error, variance, acceptance rate, and other things you want to display in the results
+
+        # Suggestion of things to display in the results
+        sample_results = {
+            "chain_id": chain_id,
+            "energy": mean_energy,
+            "std_error": std_error,
+            "variance": variance,
+            "accept_rate": acceptance_rate,
+            "scale": self.scale,
+            "nsamples": nsamples,
+        }
+
+        return sample_results
+
+    def _results_frame(self, results):
+        """DataFrame with one row per chain from a list of _chain_results dicts.
+
+        The statistics come back from the device as 0-d arrays, which pandas would store as object columns,
+        so every value is unpacked to a Python scalar first.
+        """
+        return pd.DataFrame(
+            [{key: np.asarray(value).item() for key, value in chain.items()} for chain in jax.device_get(results)]
+        )
+
+    def _sample_loop(self, nsamples, chain_id, seed=None):
+        """Python loop over the MCMC steps, updating self.alg.state in place."""
         if self._log:
             t_range = tqdm(
                 range(nsamples),
@@ -97,67 +170,170 @@ class Sampler:
         # Set the seed for the chain
         if seed is None:
             seed = self._seed
-        
+        # One generator for the whole chain instead of rebuilding one every step. Jumping by the number of steps taken
+        # so far gives every sample call its own non-overlapping stream of the same seed
+        rng = self._rng(np.random.PCG64(seed).jumped(self.alg.state.delta))
+        # The random numbers of all the steps are drawn up front, in one batched call per kind
+        draws = self.draw_randoms(rng, nsamples)
+
         sampled_positions = []
         local_energies = []     # List to store local energies
-        for _ in t_range:       # Here use range(nsamples) if you train
+        for t in t_range:       # Here use range(nsamples) if you train
             # Perform one step of the MCMC algorithm by updating the state parameters
             # WE DO NOT create a new state instance, as this is not necessary.
             self.step(
-                self.alg.prob, self.alg.state, seed
+                self.alg.prob_pair, self.alg.state, *[draw[t] for draw in draws]
             )
             E_loc = self.hami.local_energy(self.alg.wf, self.alg.state.positions)
             local_energies.append(E_loc)                    # Store local energy
             sampled_positions.append(self.alg.state.positions)
 
-        if self._logger is not None:
-            # t_range.clear()
-            pass
-            
+        # Convert lists to arrays. Only needed here, the scan path returns the stacked arrays directly.
+        # asarray rather than array, so an input that already is an array of the right dtype is not copied again
+        local_energies = self.backend.asarray(local_energies)
+        sampled_positions = self.backend.asarray(sampled_positions)
 
-        # Calculate acceptance rate and convert lists to arrays
-        # TODO: Should investigate more here
-        if config.training_cycles != 0 and nsamples != 0:
-            acceptance_rate = self.alg.state.n_accepted / (nsamples * self.alg._N * self.n_training_cycles)
+        return sampled_positions, local_energies
+
+    def draw_randoms(self, rng, nsamples):
+        """Random numbers of nsamples steps of the Python loop, drawn in one call per kind instead of in every step.
+
+        Returns the (nsamples, N, dim) standard normal proposal noise and the (nsamples, N) uniforms of the accept test,
+        step t gets the t-th slice of each.
+        """
+        N, dim = self.alg._N, self.alg._dim
+        return rng.standard_normal((nsamples, N, dim)), rng.random((nsamples, N))
+
+    def _sample_scan(self, nsamples):
+        """All the MCMC steps of a chain as a single jax.lax.scan, used for the jax backend when the wavefunction closures are pure.
+
+        The per-step keys are split once from the VMC key, and the positions and local energies come back stacked on device.
+        """
+        alpha = self.alg._alpha
+        # The proposal noise of the whole chain is drawn at once, the per-step keys are only used for the accept draws
+        noise = self.alg.generate_normal_block(nsamples, self.alg._N, self.alg._dim)
+        subkeys = self.alg.prime_keys(nsamples)
+
+        final_state, (sampled_positions, local_energies) = self._run_chain_jit(
+            self._scan_state(self.alg.state, alpha), noise, subkeys, alpha
+        )
+        self.alg.state = final_state.rebuild()
+
+        return sampled_positions, local_energies
+
+    def _scan_state(self, state, alpha):
+        """Copy of state with every field as an array, as the lax.scan carry needs a fixed structure and dtypes.
+
+        The squared radii do not depend on alpha, so they stay valid across training iterations, while logp is
+        recomputed for the current alpha. The counters are int32 whether or not x64 is enabled, and step_pure adds
+        int32 sums to them, so the carry keeps the same dtype on every step.
+        """
+        return State(
+            state.positions,
+            self.alg.prob_from_r2(state.r2, alpha),
+            jnp.asarray(state.n_accepted, dtype=jnp.int32),
+            jnp.asarray(state.delta, dtype=jnp.int32),
+            r2=state.r2,
+        )
+
+    def _sample_chains(self, nsamples, nchains):
+        """nchains chains of _sample_scan at once, vmapped over a leading chain axis (and pmapped over the devices, if
+        there are several and they divide nchains).
+
+        The first chain continues from the current state, the others start from fresh positions drawn like the initial
+        ones of VMC. Every chain gets its own proposal noise and accept keys.
+        Afterwards self.alg.state holds the final state of the first chain.
+        """
+        alpha = self.alg._alpha
+        N, dim = self.alg._N, self.alg._dim
+        noise = self.alg.generate_normal_block(nchains * nsamples, N, dim).reshape(nchains, nsamples, N, dim)
+        subkeys = self.alg.prime_keys(nchains * nsamples)
+        subkeys = subkeys.reshape((nchains, nsamples) + subkeys.shape[1:])
+        # Every field of the state gets a leading chain axis
+        init_state = jax.tree_util.tree_map(
+            lambda x: jnp.broadcast_to(x, (nchains,) + jnp.shape(x)), self._scan_state(self.alg.state, alpha)
+        )
+        # Independent starting positions for all but the first chain, with their squared radii and logp
+        fresh_positions = self.alg.generate_normal_block(nchains - 1, N, dim).astype(init_state.positions.dtype)
+        init_state.positions = jnp.concatenate([init_state.positions[:1], fresh_positions])
+        init_state.r2 = jax.vmap(self.alg.r2_closure)(init_state.positions)
+        init_state.logp = self.alg.prob_from_r2(init_state.r2, alpha)
+
+        n_devices = jax.local_device_count()
+        if n_devices > 1 and nchains % n_devices == 0:
+            def shard(x):
+                return x.reshape((n_devices, nchains // n_devices) + x.shape[1:])
+
+            def unshard(x):
+                return x.reshape((nchains,) + x.shape[2:])
+
+            final_states, outputs = self._run_chains_pmap(
+                jax.tree_util.tree_map(shard, init_state), shard(noise), shard(subkeys), alpha
+            )
+            final_states, (sampled_positions, local_energies) = jax.tree_util.tree_map(unshard, (final_states, outputs))
         else:
-            acceptance_rate = self.alg.state.n_accepted / (nsamples * self.alg._N)
-        # acceptance_rate = self.alg.state.n_accepted / (nsamples * self.alg._N)
-        local_energies = self.backend.array(local_energies)
-        sampled_positions = self.backend.array(sampled_positions)
-        mean_positions = self.backend.mean(self.backend.abs(sampled_positions), axis=0)
-        # Compute statistics of local energies
-        mean_energy = self.backend.mean(local_energies)
-        std_error = self.backend.std(local_energies) / self.backend.sqrt(nsamples)
-        variance = self.backend.var(local_energies)
-        # calculate energy, error, variance, acceptance rate, and other things you want to display in the results
+            final_states, (sampled_positions, local_energies) = self._run_chains_jit(
+                init_state, noise, subkeys, alpha
+            )
+        self.alg.state = jax.tree_util.tree_map(lambda x: x[0], final_states).rebuild()
+        n_accepted = final_states.n_accepted
 
-        # Suggestion of things to display in the results
-        sample_results = {
-            "chain_id": chain_id,
-            "energy": mean_energy,
-            "std_error": std_error,
-            "variance": variance,
-            "accept_rate": acceptance_rate,
-            "scale": self.scale,
-            "nsamples": nsamples,
-        }
+        results = [
+            self._chain_results(chain_id, nsamples, n_accepted[chain_id], sampled_positions[chain_id], local_energies[chain_id])
+            for chain_id in range(nchains)
+        ]
 
-        return sample_results, sampled_positions, local_energies
+        return results, sampled_positions, local_energies
 
-    def accept_jax(
-        self,
-        n_accepted,
-        accept,
-        initial_positions,
-        proposed_positions,
-        log_psi_current,
-        log_psi_proposed,
-    ):
+    def run_chain(self, state, noise, keys, alpha):
+        """Pure MCMC chain: lax.scan of step_pure over the proposal noise and per-step keys.
+
+        state: State carried through the scan, see _scan_state and step_pure
+        Returns the final state and the stacked (positions, local energies). alpha is passed explicitly all the way
+        down to the local energy, so this can also run inside a traced training loop.
+        """
+        def step_fn(state, xs):
+            noise_t, key = xs
+            state = self.step_pure(state, noise_t, key, alpha)
+            E_loc = self.hami.local_energy(self.alg.wf, state.positions, alpha)
+            return state, (state.positions, E_loc)
+
+        return jax.lax.scan(step_fn, state, (noise, keys))
+
+    def step_pure(self, state, noise, key, alpha):
         """
         To be implemented by subclasses
         """
         raise NotImplementedError("Subclasses must implement this method.")
 
+    def _proposal_probs(self, r2_current, proposed_positions, alpha):
+        """Squared radii of the proposal and the log probabilities of the current and proposed positions, for step_pure.
+
+        The squared radii are computed once per proposal and shared by both log probabilities.
+        """
+        r2_proposed = self.alg.r2_closure(proposed_positions)
+        return r2_proposed, self.alg.prob_from_r2(r2_current, alpha), self.alg.prob_from_r2(r2_proposed, alpha)
+
+    def _accept_pure(self, state, key, log_accept_prob, proposed_positions, r2_proposed, prob_current, prob_proposed):
+        """Accept/reject of the per-particle moves of step_pure, returns the next State of the scan.
+
+        log_accept_prob: (N,) log acceptance probabilities, the uniforms of the test are drawn in its dtype.
+        Compared in log domain so exp(log_accept_prob) can not overflow. An uphill move is always accepted, written as
+        a mask so the whole test stays one branchless fused kernel.
+        """
+        log_u = jnp.log(random.uniform(key, shape=log_accept_prob.shape, dtype=log_accept_prob.dtype))
+        accept = (log_accept_prob >= 0) | (log_u < log_accept_prob)
+
+        # accept stays boolean and the rows are picked with lax.select, a single predicated move per element.
+        # Both branches have the dtype of the carried state, as lax.select does not promote
+        new_positions = jax.lax.select(
+            jnp.broadcast_to(accept[:, None], state.positions.shape), proposed_positions, state.positions
+        )
+        new_logp = jax.lax.select(accept, prob_proposed, prob_current)
+        new_r2 = jax.lax.select(accept, r2_proposed, state.r2)
+
+        return State(new_positions, new_logp, state.n_accepted + jnp.sum(accept, dtype=jnp.int32), state.delta + 1, r2=new_r2)
+
     def accept_numpy(
         self,
         n_accepted,
@@ -9,7 +9,9 @@ nchains = 1#4# number of Markov chains. When you parallelize, you can set this t
 eta = 0 #0.001
 training_cycles = 0 #500 # this is cycles for the ansatz
 mcmc_alg = "mh" # eiteer "mh" or "m"
+single_particle = False # only for "m" on the Python loop (numpy, or jax with interaction): move one particle per step
 backend = "numpy" # or "numpy" but jax should go faster because of the jit
+precision = "fp64" # or "fp32", which only runs the scanned jax training in single precision
 optimizer = "gd"
 hamiltonian = "eo" # either ho or eo 
 interaction = "Coulomb" # either Coulomb or None
@@ -44,7 +44,8 @@ system = quantum_state.QS(
     beta=config.beta,
     radius = config.radius,
     time_step=config.time_step,
-    diffusion_coeff=config.diffusion_coeff
+    diffusion_coeff=config.diffusion_coeff,
+    precision=config.precision
 )
 
 